@@ -2,88 +2,79 @@
 Chosen-ciphertext attack on PKCS #1 v1.5
 https://www.iacr.org/archive/crypto2001/21390229.pdf
 """
+import gmpy2
 from oracles import PKCS1_OAEP_Oracle
 from Crypto.Cipher import PKCS1_OAEP
 from Crypto.PublicKey import RSA
 
 
-def divceil(a, b):
-    """
-    Accurate division with ceil, to avoid floating point errors
-    :param a: numerator
-    :param b: denominator
-    :return: ceil(a / b)
-    """
-    q, r = divmod(a, b)
-    if r:
-        return q + 1
-    return q
-
-
-def divfloor(a, b):
-    """
-    Accurate division with floor, to avoid floating point errors
-    :param a: numerator
-    :param b: denominator
-    :return: floor(a / b)
-    """
-    q, r = divmod(a, b)
-    return q
-
-def try_with_oracle(k, key, c, oracle, f):
-    attempt = ((pow(f, key.e, key.n) * c) % key.n)
+def try_with_oracle(k, n, e, c, oracle, f):
+    attempt = int(gmpy2.powmod(f, e, n) * c % n)
     return oracle.query(attempt.to_bytes(k, byteorder='big'))
 
 
-def find_f1(k, key, c, oracle):
+def find_f1(k, n, e, c, oracle):
     """
     Step 1 of the attack
     :param k: length of block in bytes
-    :param key: RSA key
+    :param n: RSA modulus (mpz)
+    :param e: RSA public exponent (mpz)
     :param c: integer representing the parameter of the attack
     :param oracle: oracle that checks whether a decryption is smaller than B
     :return: f1 such that B/2 <= f1 * m / 2 < B
     """
     f1 = 2
     # Edited: try f1 with the oracle for values 2*i
-    while try_with_oracle(k, key, c, oracle, f1):
+    # Since (2 * f1) ^ e = f1 ^ e * 2 ^ e, each step is a single multiplication instead of a modexp
+    two_e = gmpy2.powmod(2, e, n)
+    attempt = two_e * c % n
+    # f1 = 2 ** j and m >= 1, so f1 * m reaches B = 2 ** (8 * (k - 1)) after at most 8 * (k - 1) queries
+    for _ in range(8 * (k - 1)):
+        if not oracle.query(int(attempt).to_bytes(k, byteorder='big')):
+            break
         f1 *= 2
+        attempt = attempt * two_e % n
     return f1
         
 
 
-def find_f2(k, key, c, f1, oracle):
+def find_f2(k, n, e, c, f1, oracle):
     """
     Step 2 of the attack
     :param k: length of block in bytes
-    :param key: RSA key
+    :param n: RSA modulus (mpz)
+    :param e: RSA public exponent (mpz)
     :param c: integer representing the parameter of the attack
     :param f1: multiple from the previous step
     :param oracle: oracle that checks whether a decryption is smaller than B
     :return: f2 such that n <= f2 * m < n + B
     """
     B = 2 ** (8 * (k - 1))
-    f2 = divfloor(key.n + B, B) * (f1 // 2)
+    step = f1 >> 1
+    f2 = (n + B) // B * step
     # Edited: Calculate f2 exactly like in Manger
     # We are mathematically guaranteed that this step will finish
-    while not try_with_oracle(k, key, c, oracle, f2):
-        f2 += f1 // 2
+    while not try_with_oracle(k, n, e, c, oracle, f2):
+        f2 += step
     return f2
 
 
-def find_m(k, key, c, f2, oracle, verbose=False):
+def find_m(k, n, e, c, f2, oracle, verbose=False):
     """
     Step 3 of the attack
     :param k: length of block in bytes
-    :param key: RSA key
+    :param n: RSA modulus (mpz)
+    :param e: RSA public exponent (mpz)
     :param c: integer representing the parameter of the attack
     :param f2: multiple from the previous step
     :param oracle: oracle that checks whether a decryption is smaller than B
     :return: m such that (m ** e) mod n = c
     """
     B = 2 ** (8 * (k - 1))
-    m_min = divceil(key.n, f2)
-    m_max = divfloor(key.n + B, f2)
+    two_B = B << 1
+    # Exact integer division throughout; ceil(a / b) is written as -(-a // b)
+    m_min = -(-n // f2)
+    m_max = (n + B) // f2
     count = 0
     while m_max != m_min:
         if verbose:
@@ -91,13 +82,15 @@ def find_m(k, key, c, f2, oracle, verbose=False):
         count += 1
 
         # Edited: Implement Manger's pseudo-code in python (which is basically pseudo-code)
-        f_tmp = divfloor(2*B, m_max - m_min)
-        i = divfloor(f_tmp * m_min, key.n)
-        f3 = divceil(i*key.n, m_min)
-        if try_with_oracle(k, key, c, oracle, f3):
-            m_max = divfloor(i*key.n + B, f3)
+        f_tmp = two_B // (m_max - m_min)
+        i = f_tmp * m_min // n
+        i_n = i * n
+        f3 = -(-i_n // m_min)
+        i_n_B = i_n + B
+        if try_with_oracle(k, n, e, c, oracle, f3):
+            m_max = i_n_B // f3
         else:
-            m_min = divceil(i*key.n + B, f3)
+            m_min = -(-i_n_B // f3)
     return m_min
 
 
@@ -111,21 +104,24 @@ def manger_attack(k, key, c, oracle, verbose=False):
     :param oracle: oracle that checks whether a decryption is smaller than B
     :return: m such that m = (c ** d) mod n
     """
-    c = int.from_bytes(c, byteorder='big')
+    # Work with mpz values, so every modexp goes through GMP's powmod
+    n = gmpy2.mpz(key.n)
+    e = gmpy2.mpz(key.e)
+    c = gmpy2.mpz(int.from_bytes(c, byteorder='big'))
 
-    f1 = find_f1(k, key, c, oracle)
+    f1 = find_f1(k, n, e, c, oracle)
     if verbose:
         print("f1 =", f1)
 
-    f2 = find_f2(k, key, c, f1, oracle)
+    f2 = find_f2(k, n, e, c, f1, oracle)
     if verbose:
         print("f2 =", f2)
 
-    m = find_m(k, key, c, f2, oracle, True)
+    m = find_m(k, n, e, c, f2, oracle, True)
 
     # Test the result - if implemented properly the attack should always succeed
-    if pow(m, key.e, key.n) == c:
-        return m.to_bytes(k, byteorder='big')
+    if gmpy2.powmod(m, e, n) == c:
+        return int(m).to_bytes(k, byteorder='big')
     else:
         return None
     
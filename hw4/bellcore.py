@@ -1,57 +1,21 @@
+from math import gcd
 from Crypto.PublicKey import RSA
 from oracles import RSA_CRT
 
 
-def divceil(a, b):
-    """
-    Accurate division with ceil, to avoid floating point errors
-    :param a: numerator
-    :param b: denominator
-    :return: ceil(a / b)
-    """
-    q, r = divmod(a, b)
-    if r:
-        return q + 1
-    return q
-
-
-def divfloor(a, b):
-    """
-    Accurate division with floor, to avoid floating point errors
-    :param a: numerator
-    :param b: denominator
-    :return: floor(a / b)
-    """
-    q, r = divmod(a, b)
-    return q
-
-
-def egcd(a, b):
-    """
-    Use Euclid's algorithm to find gcd of a and b
-    """
-    if a == 0:
-        return b, 0, 1
-    else:
-        g, y, x = egcd(b % a, a)
-        return g, x - (b // a) * y, y
-
-
 def modinv(a, m):
     """
     Compute modular inverse of a over m
     """
-    g, x, y = egcd(a, m)
-    if g != 1:
+    try:
+        return pow(a, -1, m)
+    except ValueError:
         raise Exception('modular inverse does not exist')
-    else:
-        return x % m
 
 
 class RSA_oracle(RSA_CRT):
     def __init__(self, key):
         self._q_inv = modinv(key.q, key.p)
-        self._p_inv = modinv(key.p, key.q)
         super(RSA_oracle, self).__init__(key)
 
     def dec(self, c):
@@ -79,12 +43,14 @@ class RSA_oracle(RSA_CRT):
 
     def CRT(self, m_p, m_q):
         """
-        Combine m_p and m_q to find m, exactly as was shown in class
+        Combine m_p and m_q to find m, using Garner's form of the CRT:
+        m = m_q + q * ((m_p - m_q) * q^-1 mod p)
         :param m_p: m mod p
         :param m_q: m mod q
         :return: m
         """
-        return (m_p * self._q * self._q_inv + m_q * self._p * self._p_inv) % self.n
+        h = ((m_p - m_q) * self._q_inv) % self._p
+        return m_q + self._q * h
 
 
 def bellcore_attack(rsa):
@@ -98,7 +64,7 @@ def bellcore_attack(rsa):
     MESSAGE_TO_DECRYPT = 0x1000
     m = rsa.dec(MESSAGE_TO_DECRYPT)
     m_prime = rsa.faulty_dec(MESSAGE_TO_DECRYPT)
-    q = abs(egcd(rsa.n, m - m_prime)[0])
+    q = gcd(rsa.n, m - m_prime)
     p = rsa.n // q
 
     # Test the output
@@ -2,42 +2,72 @@
 An algorithm for collision detection
 """
 
-from prf import PRF
+from numba import njit
+from prf import PRF, prf_step
 
 
-def find_collision(f, start):
+def _find_collision(f, start):
     """
-    :param f: oracle for a random function
+    Search for a collision with Brent's cycle detection
+    Runs as is on a PRF, and compiled as _find_collision_jit on aes_prf
+    :param f: oracle for a random function, or the aes_prf arguments of one when compiled
     :param start: starting point
-    :return: x_0, x_1 such that x_0 != x_1 and f(x_0) = f(x_1)
+    :return: x_0, x_1 such that x_0 != x_1 and f(x_0) = f(x_1), or start, start if the search failed
     """
     # Maybe we are lucky
-    if f.calc(start) == start:
+    if prf_step(f, start) == start:
         return start, start
 
-    p1 = f.calc(start)
-    p2 = f.calc(f.calc(start))
-    count = 0
+    # Brent's cycle detection: the tortoise jumps to the hare at every power of two,
+    # and lam ends up as the length of the cycle
+    power = lam = 1
+    p1 = start
+    p2 = prf_step(f, start)
     while p1 != p2:
-        count += 1
-        p1 = f.calc(p1)
-        p2 = f.calc(f.calc(p2))
+        if power == lam:
+            p1 = p2
+            power *= 2
+            lam = 0
+        p2 = prf_step(f, p2)
+        lam += 1
 
-    # Check if we started at the cycle
-    for _ in range(count * 2):
-        p1 = f.calc(p1)
-        if p1 == start:
-            print("Failed")
-            return start, start
+    # Put p2 lam steps ahead of start. It comes back to start exactly when we started at the cycle
+    p2 = start
+    for _ in range(lam):
+        p2 = prf_step(f, p2)
+    if p2 == start:
+        print("Failed")
+        return start, start
 
     # Find the collision point
+    # Keep the previous points, so each step costs one PRF call per pointer
     p1 = start
-    while f.calc(p1) != f.calc(p2):
-        p1 = f.calc(p1)
-        p2 = f.calc(p2)
+    next1 = prf_step(f, p1)
+    next2 = prf_step(f, p2)
+    while next1 != next2:
+        p1, p2 = next1, next2
+        next1 = prf_step(f, p1)
+        next2 = prf_step(f, p2)
     return p1, p2
 
 
+_find_collision_jit = njit(cache=True)(_find_collision)
+
+
+def find_collision(f, start):
+    """
+    The search runs compiled when f.jit_args allows it,
+    and falls back to a python loop over f.calc otherwise
+    :param f: oracle for a random function
+    :param start: starting point
+    :return: x_0, x_1 such that x_0 != x_1 and f(x_0) = f(x_1)
+    """
+    jit_args = f.jit_args()
+    if jit_args is None:
+        return _find_collision(f, start)
+    return _find_collision_jit(jit_args, start)
+
+
 def main():
     key = b'\xde\xa4\xf3l\x99~\x13\xed\xf5\x16\xe4#\xc1\xa4\xef\x04'
     block_size = 4
@@ -2,9 +2,11 @@
 An algorithm for a time-memory tradeoff
 """
 
+import numpy as np
+from math import isqrt
 from prf import PRF
 from os import urandom
-from collections import defaultdict
+from multiprocessing import Pool, shared_memory
 
 
 class ModifiedPRF(object):
@@ -14,6 +16,12 @@ class ModifiedPRF(object):
         :param f: oracle for a random function
         """
         self.f = f
+        # Bind the attributes used on every call, and precompute which case of calc applies:
+        # -1 for domain < range, 1 for domain > range, 0 for domain = range
+        self._domain = f.domain
+        self._rang = f.rang
+        self._fcalc = f.calc
+        self._mode = (f.domain > f.rang) - (f.domain < f.rang)
 
     def calc(self, x):
         """
@@ -22,15 +30,38 @@ class ModifiedPRF(object):
         :param x: input
         :return: random consistent output
         """
-        domain = self.f.domain
-        rang = self.f.rang
+        mode = self._mode
+        if mode < 0:
+            return self._fcalc(x % self._domain)
+        elif mode > 0:
+            # Callers reduce x modulo the domain, so x + 1 wraps at most once
+            xp1 = x + 1
+            if xp1 >= self._domain:
+                xp1 -= self._domain
+            return self._fcalc(x + xp1*self._rang)
+        else:
+            return self._fcalc(x)
+
+    def calc_batch(self, xs):
+        """
+        Calculate the modified f over an array of inputs
+        Assumes the domain and range of f are both at most 8 bytes
+        :param xs: np.uint64 array of inputs
+        :return: np.uint64 array of outputs, where output j is self.calc(xs[j])
+        """
+        xs = np.asarray(xs, dtype=np.uint64)
 
-        if domain < rang:
-            return self.f.calc(x % domain)
-        elif domain > rang:
-            return self.f.calc(x + ((x + 1)%domain)*rang)
+        # The domain is a power of two, so reduce with a mask. np.uint64(2**64) would overflow for an 8 byte domain
+        domain_mask = np.uint64(self._domain - 1)
+        if self._mode < 0:
+            return self.f.calc_batch(xs & domain_mask)
+        elif self._mode > 0:
+            # The range is smaller than the domain here, so it fits in a np.uint64. The product may wrap,
+            # but f only keeps the low domain bits of its input, which the wrap doesn't change
+            rang = np.uint64(self._rang)
+            return self.f.calc_batch(xs + ((xs + np.uint64(1)) & domain_mask) * rang)
         else:
-            return self.f.calc(x)
+            return self.f.calc_batch(xs)
 
     def recover_x(self, x):
         """
@@ -38,38 +69,65 @@ class ModifiedPRF(object):
         :param x: x such that self.calc_new(x) = y
         :return: x' such that self.f.calc(x') = y
         """
-        domain = self.f.domain
-        rang = self.f.rang
+        domain = self._domain
+        rang = self._rang
 
-        if domain < rang:
+        if self._mode < 0:
             return (x%domain)
-        elif domain > rang:
-            return x + ((x + 1)%domain)*rang
+        elif self._mode > 0:
+            xp1 = x + 1
+            if xp1 >= domain:
+                xp1 -= domain
+            return x + xp1*rang
         else:
             return x
 
 
-def hellman_preprocess(m, t, f_tag):
+def random_points(m, domain_bytes):
+    """
+    Sample uniformly random inputs
+    :param m: number of points
+    :param domain_bytes: size of each point in bytes, at most 8
+    :return: np.uint64 array of m random points
+    """
+    padded = np.zeros((m, 8), dtype=np.uint8)
+    padded[:, 8 - domain_bytes:] = np.frombuffer(urandom(m * domain_bytes), dtype=np.uint8).reshape(m, domain_bytes)
+    return padded.view('>u8').ravel().astype(np.uint64)
+
+
+def hellman_preprocess(m, t, f_tag, k=1):
     """
     Preprocess hellman tables
+    Keeping the points of the chains lets hellman_online find the point before y without walking the chain
+    from its start, but every kept point costs another 8 bytes per chain. With k=1 the tables are t+1 times
+    the size of a table of start and end points only, so keep every k-th point and let hellman_online walk
+    at most k-1 steps from the nearest kept point
     :param m: number of chains in each table
     :param t: length of the chains, and the number of tables
     :param f_tag: oracle for a random function
-    :return: a list of tables, where each table is a dictionary from the end points to the start points
+    :param k: distance between the kept points of each chain
+    :return: a list of tables, where each table is a triple (end points, chains, k) with the arrays sorted by the
+        end points, and each chain holds the points at positions 0, k, 2k, ... before its end point
     """
+    # The tables hold np.uint64 values, so wider PRFs can't be stored
+    if f_tag.f.domain_bytes > 8 or f_tag.f.rang_bytes > 8:
+        raise ValueError('hellman tables support domains and ranges of at most 8 bytes')
+
     tables = []
+    domain_mask = np.uint64(f_tag.f.domain - 1)
+    domain_bytes = f_tag.f.domain_bytes
+    calc_batch = f_tag.calc_batch
     for i in range(t):
-        table = defaultdict(list)
+        # The chains are independent, so walk all of them together, one batched PRF call per step
+        chains = np.empty((m, (t - 1) // k + 1), dtype=np.uint64)
+        curr = random_points(m, domain_bytes)
+        for step in range(t):
+            if step % k == 0:
+                chains[:, step // k] = curr
+            curr = calc_batch((curr + np.uint64(i)) & domain_mask)
 
-        for _ in range(m):
-            start = int.from_bytes(urandom(f_tag.f.domain_bytes), byteorder='big')
-            curr = start
-            for _ in range(t):
-                next = f_tag.calc((curr + i) % f_tag.f.domain)
-                curr = next
-            table[curr].append(start)
-
-        tables.append(table)
+        order = np.argsort(curr, kind='stable')
+        tables.append((curr[order], chains[order], k))
         if i % 32 == 0:
             print(i)
     return tables
@@ -84,19 +142,81 @@ def hellman_online(tables, t, y, f_tag):
     :param f_tag: modified oracle for a random function
     :return: x such that f(x)=y if the attack succeeded, else None
     """
+    domain = f_tag.f.domain
+    calc = f_tag.calc
     for i in range(len(tables)):
+        ends, chains, k = tables[i]
         curr = y
-        for _ in range(t):
-            if len(tables[i][curr]) > 0:
-                for a in tables[i][curr]:
-                    for _ in range(t):
-                        if f_tag.calc((a + i) % f_tag.f.domain) == y:
-                            return (a+i)%f_tag.f.domain
-                        a = f_tag.calc((a + i) % f_tag.f.domain)
-            curr = f_tag.calc((curr + i) % f_tag.f.domain)
+        for s in range(t):
+            # Search with a uint64 key, a python int would make numpy convert the whole array
+            key = np.uint64(curr)
+            lo = ends.searchsorted(key)
+            if lo < len(ends) and ends[lo] == key:
+                hi = ends.searchsorted(key, side='right')
+                # y is s steps before the end point, so the point before it is at position p of the chain
+                p = t - s - 1
+                for chain in chains[lo:hi]:
+                    # Walk to it from the nearest kept point
+                    a = int(chain[p // k])
+                    for _ in range(p % k):
+                        a = calc((a + i) % domain)
+                    x = (a + i) % domain
+                    if calc(x) == y:
+                        return x
+            curr = calc((curr + i) % domain)
     return None
 
 
+def _to_shared(arrays):
+    """
+    Copy arrays of the same shape into a new shared memory block, stacked along a new first axis
+    :param arrays: list of np.uint64 arrays of the same shape
+    :return: the shared memory block, and the shape of the stacked array
+    """
+    shape = (len(arrays),) + arrays[0].shape
+    block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+    stacked = np.ndarray(shape, dtype=np.uint64, buffer=block.buf)
+    for j, array in enumerate(arrays):
+        stacked[j] = array
+    return block, shape
+
+
+_worker_args = None
+_worker_blocks = None
+
+
+def _init_worker(ends_name, ends_shape, chains_name, chains_shape, ks, t, f_tag):
+    """
+    Attach a worker process to the shared tables
+    Only the names and shapes of the shared memory blocks are sent to the worker, not the tables themselves
+    :param ends_name: name of the shared memory block of the end points of all the tables
+    :param ends_shape: shape of the end points, (number of tables, m)
+    :param chains_name: name of the shared memory block of the chains of all the tables
+    :param chains_shape: shape of the chains, (number of tables, m, number of kept points)
+    :param ks: the k of each table
+    :param t: length of the chains, and the number of tables
+    :param f_tag: modified oracle for a random function
+    """
+    global _worker_args, _worker_blocks
+    # Keep the blocks referenced, the arrays are only views of their memory
+    _worker_blocks = shared_memory.SharedMemory(name=ends_name), shared_memory.SharedMemory(name=chains_name)
+    ends = np.ndarray(ends_shape, dtype=np.uint64, buffer=_worker_blocks[0].buf)
+    chains = np.ndarray(chains_shape, dtype=np.uint64, buffer=_worker_blocks[1].buf)
+    tables = [(ends[i], chains[i], ks[i]) for i in range(ends_shape[0])]
+    _worker_args = tables, t, f_tag
+
+
+def _query_worker(y):
+    """
+    Run a single online query in a worker process
+    :param y: input
+    :return: True if the attack found x such that f(x)=y, else False
+    """
+    tables, t, f_tag = _worker_args
+    x = hellman_online(tables, t, y, f_tag)
+    return x is not None and f_tag.f.calc(f_tag.recover_x(x)) == y
+
+
 def run_hellman(f, m, t):
     """
     Run the Hellman algorithm to reverse f
@@ -107,18 +227,31 @@ def run_hellman(f, m, t):
     """
     f_tag = ModifiedPRF(f)
 
-    tables = hellman_preprocess(m, t, f_tag)
+    # Keeping every sqrt(t)-th point of the chains keeps the tables small, and costs at most sqrt(t) PRF calls
+    # per matching chain in hellman_online
+    tables = hellman_preprocess(m, t, f_tag, isqrt(t))
     print("Loaded tables")
 
-    success_count = 0
-    for _ in range(100):
-        y = f.calc(int.from_bytes(urandom(f.domain_bytes), byteorder='big'))
-        x = hellman_online(tables, t, y, f_tag)
-        if x is not None:
-            x = f_tag.recover_x(x)
-            if f.calc(x) == y:
-                success_count += 1
-    return success_count
+    calc = f.calc
+    domain_bytes = f.domain_bytes
+    ys = [calc(int.from_bytes(urandom(domain_bytes), byteorder='big')) for _ in range(100)]
+
+    # The queries are independent and only read the tables, so spread them over all cores.
+    # The tables go to shared memory, so the workers don't each get a pickled copy of them
+    ends_block, ends_shape = _to_shared([ends for ends, _, _ in tables])
+    chains_block, chains_shape = _to_shared([chains for _, chains, _ in tables])
+    ks = [k for _, _, k in tables]
+    del tables
+    try:
+        initargs = (ends_block.name, ends_shape, chains_block.name, chains_shape, ks, t, f_tag)
+        with Pool(initializer=_init_worker, initargs=initargs) as pool:
+            results = pool.map(_query_worker, ys)
+    finally:
+        ends_block.close()
+        ends_block.unlink()
+        chains_block.close()
+        chains_block.unlink()
+    return sum(results)
 
 
 def test_1():
@@ -2,38 +2,62 @@
 An algorithm for cycle detection
 """
 
-from prf import PRF
+import numpy as np
+from numba import njit
+from prf import PRF, prf_step
 
 
-def find_cycle(f, k, start):
+def _find_cycle(f, dtype, k, start):
     """
-    Return a point x, where x is the first point detected by the Nivasch algorithm
-    :param f: oracle for a random function
+    Walk from start with the Nivasch stack algorithm until a point repeats
+    Runs as is on a PRF, and compiled as _find_cycle_jit on aes_prf
+    :param f: oracle for a random function, or the aes_prf arguments of one when compiled
+    :param dtype: dtype of the stacks, np.int64 when compiled and object for points that don't fit in it
     :param k: the number of stacks to use
     :param start: starting point for the algorithm
     :return: x, where x is a point inside of a cycle
     """
-    stacks = []
-    for _ in range(k):
-        stacks.append([])
-    
-    stacks[start % k].append(start)
+    # Stack b is stacks[b, :lens[b]]; the rows are doubled whenever one of them fills up
+    stacks = np.empty((k, 64), dtype=dtype)
+    lens = np.zeros(k, dtype=np.int64)
+
+    stacks[start % k, 0] = start
+    lens[start % k] = 1
     next = start
     while True:
-        next = f.calc(next)
-        if next in stacks[next % k]:
-            return next
+        next = prf_step(f, next)
+        b = next % k
+        for j in range(lens[b]):
+            if stacks[b, j] == next:
+                return next
 
-        if (len(stacks[next % k]) == 0):
-            stacks[next % k].append(next)
-            continue
+        while lens[b] > 0 and stacks[b, lens[b] - 1] > next:
+            lens[b] -= 1
+        if lens[b] == stacks.shape[1]:
+            grown = np.empty((k, 2 * stacks.shape[1]), dtype=stacks.dtype)
+            grown[:, :stacks.shape[1]] = stacks
+            stacks = grown
+        stacks[b, lens[b]] = next
+        lens[b] += 1
 
-        while stacks[next % k][-1] > next:
-            stacks[next % k].pop()
-            if len(stacks[next % k]) == 0:
-                break
-        stacks[next % k].append(next)
 
+_find_cycle_jit = njit(cache=True)(_find_cycle)
+
+
+def find_cycle(f, k, start):
+    """
+    Return a point x, where x is the first point detected by the Nivasch algorithm
+    The walk runs compiled when f.jit_args allows it,
+    and falls back to a python loop over f.calc otherwise
+    :param f: oracle for a random function
+    :param k: the number of stacks to use
+    :param start: starting point for the algorithm
+    :return: x, where x is a point inside of a cycle
+    """
+    jit_args = f.jit_args()
+    if jit_args is None:
+        return _find_cycle(f, object, k, start)
+    return _find_cycle_jit(jit_args, np.int64, k, start)
 
 
 def main():
@@ -1,6 +1,126 @@
+import numpy as np
+from numba import njit
+from numba.extending import overload
 from Crypto.Cipher import AES
 
 
+def _make_tables():
+    """
+    Build the AES S-box and the four encryption T-tables (fips-197 sections 5.1.1 and 5.1.3)
+    :return: S-box as an array of 256 values, T-tables as a 4x256 array of 32-bit words
+    """
+    def xtime(a):
+        a <<= 1
+        return a ^ 0x11b if a & 0x100 else a
+
+    sbox = [0] * 256
+    p = q = 1
+    # Walk the multiplicative group with generator 3, keeping q = p^-1
+    while True:
+        p ^= xtime(p)
+        q ^= q << 1
+        q ^= q << 2
+        q ^= q << 4
+        q &= 0xff
+        if q & 0x80:
+            q ^= 0x09
+        rot = q ^ ((q << 1) | (q >> 7)) ^ ((q << 2) | (q >> 6)) ^ ((q << 3) | (q >> 5)) ^ ((q << 4) | (q >> 4))
+        sbox[p] = (rot ^ 0x63) & 0xff
+        if p == 1:
+            break
+    sbox[0] = 0x63
+
+    tables = np.empty((4, 256), dtype=np.int64)
+    for x in range(256):
+        s = sbox[x]
+        word = (xtime(s) << 24) | (s << 16) | (s << 8) | (xtime(s) ^ s)
+        for i in range(4):
+            tables[i, x] = word
+            word = ((word >> 8) | (word << 24)) & 0xffffffff
+    return np.array(sbox, dtype=np.int64), tables
+
+
+_SBOX, _T = _make_tables()
+
+# aes_prf works on int64 values, so it only matches PRF.calc for domains and ranges of up to this many bytes
+AES_PRF_MAX_BYTES = 7
+
+
+def _expand_key(key):
+    """
+    AES-128 key expansion (fips-197 section 5.2)
+    :param key: 16 byte AES key
+    :return: 11x4 array of round key words
+    """
+    if len(key) != 16:
+        raise ValueError('aes_prf only supports 16 byte keys')
+    words = [int.from_bytes(key[i:i + 4], byteorder='big') for i in range(0, 16, 4)]
+    rcon = 1
+    for i in range(4, 44):
+        tt = words[i - 1]
+        if i % 4 == 0:
+            tt = ((int(_SBOX[(tt >> 16) & 0xff]) << 24) | (int(_SBOX[(tt >> 8) & 0xff]) << 16) |
+                  (int(_SBOX[tt & 0xff]) << 8) | int(_SBOX[tt >> 24])) ^ (rcon << 24)
+            rcon = (rcon << 1) ^ (0x11b if rcon & 0x80 else 0)
+        words.append(words[i - 4] ^ tt)
+    return np.array(words, dtype=np.int64).reshape(11, 4)
+
+
+@njit(cache=True)
+def aes_prf(round_keys, domain_mask, rang_mask, x):
+    """
+    Compiled equivalent of PRF.calc, for use inside other compiled loops
+    Assumes the domain and range are both at most 7 bytes, so all values fit in an int64
+    :param round_keys: PRF.round_keys
+    :param domain_mask: PRF.domain - 1
+    :param rang_mask: PRF.rang - 1
+    :param x: input
+    :return: random consistent output
+    """
+    x &= domain_mask
+    # The input block is x as 16 big-endian bytes, so only the last two words are non-zero
+    t0 = round_keys[0, 0]
+    t1 = round_keys[0, 1]
+    t2 = (x >> 32) ^ round_keys[0, 2]
+    t3 = (x & 0xffffffff) ^ round_keys[0, 3]
+    for r in range(1, 10):
+        a0 = _T[0, t0 >> 24] ^ _T[1, (t1 >> 16) & 0xff] ^ _T[2, (t2 >> 8) & 0xff] ^ _T[3, t3 & 0xff] ^ round_keys[r, 0]
+        a1 = _T[0, t1 >> 24] ^ _T[1, (t2 >> 16) & 0xff] ^ _T[2, (t3 >> 8) & 0xff] ^ _T[3, t0 & 0xff] ^ round_keys[r, 1]
+        a2 = _T[0, t2 >> 24] ^ _T[1, (t3 >> 16) & 0xff] ^ _T[2, (t0 >> 8) & 0xff] ^ _T[3, t1 & 0xff] ^ round_keys[r, 2]
+        a3 = _T[0, t3 >> 24] ^ _T[1, (t0 >> 16) & 0xff] ^ _T[2, (t1 >> 8) & 0xff] ^ _T[3, t2 & 0xff] ^ round_keys[r, 3]
+        t0, t1, t2, t3 = a0, a1, a2, a3
+    # The last round has no MixColumns, and only the low 64 bits of the output are needed
+    o2 = ((_SBOX[t2 >> 24] << 24) | (_SBOX[(t3 >> 16) & 0xff] << 16) |
+          (_SBOX[(t0 >> 8) & 0xff] << 8) | _SBOX[t1 & 0xff]) ^ round_keys[10, 2]
+    o3 = ((_SBOX[t3 >> 24] << 24) | (_SBOX[(t0 >> 16) & 0xff] << 16) |
+          (_SBOX[(t1 >> 8) & 0xff] << 8) | _SBOX[t2 & 0xff]) ^ round_keys[10, 3]
+    return ((o2 << 32) | o3) & rang_mask
+
+
+def prf_step(f, x):
+    """
+    Calculate f on x, for algorithms that are written once and also compiled
+    In compiled code f is the tuple (round_keys, domain_mask, rang_mask) returned by PRF.jit_args
+    :param f: oracle for a random function
+    :param x: input
+    :return: random consistent output
+    """
+    return f.calc(x)
+
+
+@overload(prf_step)
+def _prf_step_jit(f, x):
+    """
+    Compiled implementation of prf_step
+    :param f: type of the (round_keys, domain_mask, rang_mask) tuple
+    :param x: type of the input
+    :return: implementation that calls aes_prf
+    """
+    def impl(f, x):
+        return aes_prf(f[0], f[1], f[2], x)
+    return impl
+
+
 class PRF(object):
     def __init__(self, key, domain_bytes, rang_bytes=None):
         """
@@ -17,7 +137,23 @@ class PRF(object):
         else:
             self.rang = self.domain
             self.rang_bytes = domain_bytes
+        self.key = key
         self.cipher = AES.new(key, AES.MODE_ECB)
+        # Round keys for aes_prf, which only implements AES-128
+        self.round_keys = _expand_key(key) if len(key) == 16 else None
+
+    def jit_args(self):
+        """
+        Arguments for running this PRF as aes_prf in compiled code
+        :return: the tuple (round_keys, domain_mask, rang_mask), or None if aes_prf can't compute this PRF
+        """
+        if self.round_keys is None or self.domain_bytes > AES_PRF_MAX_BYTES or self.rang_bytes > AES_PRF_MAX_BYTES:
+            return None
+        return self.round_keys, self.domain - 1, self.rang - 1
+
+    def __reduce__(self):
+        # The AES cipher object can't be pickled, so rebuild the PRF from its key
+        return PRF, (self.key, self.domain_bytes, self.rang_bytes)
 
     def calc(self, x):
         """
@@ -28,3 +164,16 @@ class PRF(object):
         x = x & (self.domain - 1)
         x = x.to_bytes(16, byteorder='big')
         return int.from_bytes(self.cipher.encrypt(x), byteorder='big') & (self.rang - 1)
+
+    def calc_batch(self, xs):
+        """
+        Calculate the PRF over an array of inputs with a single AES call
+        Assumes the domain and range are both at most 8 bytes
+        :param xs: np.uint64 array of inputs
+        :return: np.uint64 array of outputs, where output j is self.calc(xs[j])
+        """
+        xs = np.asarray(xs, dtype=np.uint64) & np.uint64(self.domain - 1)
+        blocks = np.zeros((len(xs), 2), dtype='>u8')
+        blocks[:, 1] = xs
+        encrypted = np.frombuffer(self.cipher.encrypt(blocks.tobytes()), dtype='>u8').reshape(-1, 2)
+        return encrypted[:, 1].astype(np.uint64) & np.uint64(self.rang - 1)